@@ -14,11 +14,19 @@ similar datasets."""
 # Imports
 import numpy as np
 import pandas as pd
+import matplotlib
+from pathlib import Path
+from typing import List, Tuple, Dict, Optional
+from params import Config
+
+# Use the non-interactive Agg backend when the plot is only saved, so no GUI
+# toolkit is loaded. This must happen before pyplot is imported.
+if not Config.DISPLAY_PLOT:
+    matplotlib.use('Agg')
+
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 from matplotlib.colors import to_rgba
-from typing import List, Tuple, Dict, Optional
-from params import Config
 
 
 # Parameters
@@ -28,6 +36,16 @@ PRIMARY_DARK_COLOR = 'dimgrey'
 SECONDARY_DARK_COLOR = 'darkslategrey'
 BACKGROUND_COLOR = 'aliceblue'
 
+# Last headless heatmap figure, reused while the layout stays the same: (key, figure).
+# The figure is closed in pyplot, so callers' plt.* calls never draw onto it.
+_CACHED_FIG: Optional[tuple] = None
+
+# Optional numba kernel (see _get_rasterize_kernel): None until first use, False if
+# numba is missing. It only pays for its import and JIT/cache-load cost past
+# _NUMBA_MIN_CELLS mask cells (about 60x the dummy dataset).
+_RASTERIZE_KERNEL = None
+_NUMBA_MIN_CELLS = 16_000_000
+
 
 # Global matplotlib style configuration
 plt.rcParams['axes.facecolor'] = BACKGROUND_COLOR
@@ -89,90 +107,167 @@ def process_boolean_columns(df: pd.DataFrame,
     - selected_bases: Optional list of base names to include. If None, all columns (except ignored) are used.
 
     Returns:
-    - data_matrix: NumPy array of ints where True -> 1 and False -> 0.
+    - data_matrix: NumPy uint8 array where True -> 1 and False -> 0. The string 'False'
+      counts as False; other values follow Python truthiness (e.g. NaN -> 1).
     - bases: List of base names for each processed column.
     - suffixes: List of suffixes for each processed column.
     """
-    bool_cols_all = [col for col in df.columns if col not in ignore_cols]
-
-    df[bool_cols_all] = df[bool_cols_all].replace(
-        {'True': True, 'False': False}).astype(bool)
-
-   # Convert values to boolean (if stored as strings)
-    # df.loc[:, bool_cols_all] = df.loc[:, bool_cols_all].astype(bool)
-
-    # Extract base and suffix for each column
-    bases_all, suffixes_all = zip(
-        *[extract_base_suffix(col) for col in bool_cols_all])
-    bases_all = list(bases_all)
-    suffixes_all = list(suffixes_all)
+    ignore = frozenset(ignore_cols)
+    bool_cols_all = [col for col in df.columns if col not in ignore]
+
+    # Extract base and suffix for each column (same split as extract_base_suffix).
+    bases_all: List[str] = []
+    suffixes_all: List[str] = []
+    for col in bool_cols_all:
+        idx = col.rfind('_')
+        if idx < 0:
+            bases_all.append(col)
+            suffixes_all.append('')
+        else:
+            bases_all.append(col[:idx])
+            suffixes_all.append(col[idx + 1:])
 
     if selected_bases is None:
         bool_cols = bool_cols_all
         bases = bases_all
         suffixes = suffixes_all
     else:
-        indices = [i for i, base in enumerate(
-            bases_all) if base in selected_bases]
-        indices.sort(key=lambda i: selected_bases.index(bases_all[i]))
+        # Rank each selected base by its first position for O(1) lookups.
+        order = {base: i for i, base in enumerate(
+            dict.fromkeys(selected_bases))}
+        indices = [i for i, base in enumerate(bases_all) if base in order]
+        indices.sort(key=lambda i: order[bases_all[i]])
         bool_cols = [bool_cols_all[i] for i in indices]
         bases = [bases_all[i] for i in indices]
         suffixes = [suffixes_all[i] for i in indices]
 
-    data_matrix = df[bool_cols].astype(int).to_numpy()
+    # Build the matrix straight from the raw column arrays, converting values to
+    # boolean (if stored as strings). Column-major to match the per-column image access.
+    data_matrix = np.empty((len(df), len(bool_cols)), dtype=np.uint8, order='F')
+    for j, col in enumerate(bool_cols):
+        values = df[col].to_numpy()
+        if values.dtype == object:
+            # 'False' maps to False; anything else keeps its Python truthiness,
+            # so 'True', NaN and other non-empty strings count as True.
+            data_matrix[:, j] = values.astype(bool) & (values != 'False')
+        else:
+            data_matrix[:, j] = values.astype(bool, copy=False)
 
     return data_matrix, bases, suffixes
 
 
-def generate_color_map(suffixes: List[str]) -> Tuple[Dict[str, tuple], List[tuple]]:
+def generate_color_map(suffixes: List[str]) -> Tuple[Dict[str, tuple], np.ndarray]:
     """
     Generates a color map for a list of suffixes, assigning an RGBA color to each unique suffix.
 
     Depending on the number of unique suffixes, colors are chosen from matplotlib's 'tab10' or 'tab20' colormap.
-    Also returns a list of colors mapped in the input order of suffixes.
+    Also returns an array of colors mapped in the input order of suffixes.
 
     Parameters:
     - suffixes: A list of suffix strings.
 
     Returns:
     - color_map: A dictionary mapping each unique suffix to its RGBA color.
-    - column_colors: A list of RGBA colors corresponding to each suffix in the input order.
+    - column_colors: An (n_suffixes, 4) array of RGBA colors corresponding to each suffix in the input order.
     """
     unique_suffixes = sorted(set(suffixes))
     num_suffixes = len(unique_suffixes)
-    cmap = plt.cm.get_cmap('tab10' if num_suffixes <=
-                           10 else 'tab20', num_suffixes)
-    color_map = {suffix: to_rgba(cmap(i))
+    cmap = plt.get_cmap('tab10' if num_suffixes <=
+                        10 else 'tab20', num_suffixes)
+    # Colormaps already return RGBA; sample them all in one call.
+    rgba = cmap(np.arange(num_suffixes)).astype(np.float32)
+    color_map = {suffix: tuple(rgba[i])
                  for i, suffix in enumerate(unique_suffixes)}
-    column_colors = [color_map[sfx] for sfx in suffixes]
+    # Gather each column's color from the per-suffix lookup table.
+    order = {suffix: i for i, suffix in enumerate(unique_suffixes)}
+    column_colors = rgba[np.array([order[sfx] for sfx in suffixes], dtype=int)]
     return color_map, column_colors
 
 
+def _get_rasterize_kernel():
+    """
+    Returns the numba rasterization kernel, importing numba and building it on first use.
+
+    Returns None when numba is not installed. Importing lazily keeps numba's import and
+    JIT/cache-load cost off runs whose images are too small to benefit from it.
+    """
+    global _RASTERIZE_KERNEL
+    if _RASTERIZE_KERNEL is None:
+        try:
+            from numba import njit, prange
+        except ImportError:
+            _RASTERIZE_KERNEL = False
+            return None
+
+        @njit(parallel=True, cache=True)
+        def _rasterize_boolean_image(mask: np.ndarray,
+                                     colors: np.ndarray,
+                                     bg: np.ndarray,
+                                     out: np.ndarray) -> None:
+            """
+            Fills out (n_columns, n_rows, 4) in place: column color where mask is True,
+            background color elsewhere.
+            """
+            n_cols, n_rows = mask.shape
+            for c in prange(n_cols):
+                for r in range(n_rows):
+                    if mask[c, r]:
+                        out[c, r, 0] = colors[c, 0]
+                        out[c, r, 1] = colors[c, 1]
+                        out[c, r, 2] = colors[c, 2]
+                        out[c, r, 3] = colors[c, 3]
+                    else:
+                        out[c, r, 0] = bg[0]
+                        out[c, r, 1] = bg[1]
+                        out[c, r, 2] = bg[2]
+                        out[c, r, 3] = bg[3]
+
+        _RASTERIZE_KERNEL = _rasterize_boolean_image
+    return _RASTERIZE_KERNEL or None
+
+
 def create_boolean_image(data_matrix: np.ndarray,
-                         column_colors: List[tuple],
-                         bg_color: tuple = (240/255, 248/255, 1, 1.0)) -> np.ndarray:
+                         column_colors: np.ndarray,
+                         bg_color: tuple = (240/255, 248/255, 1, 1.0),
+                         out: Optional[np.ndarray] = None) -> np.ndarray:
     """
     Create an image (NumPy array) representing boolean data using a custom background color.
     For each boolean column, cells with True are colored as specified in column_colors.
+    Uses a numba kernel for very large images when numba is installed, a NumPy
+    broadcast otherwise.
     The final image has shape (n_boolean_columns, n_rows, 4).
 
     Parameters:
     - data_matrix: A boolean (or int) matrix with shape (n_rows, n_columns).
-    - column_colors: A list of RGBA tuples for each column.
+    - column_colors: An (n_columns, 4) array of RGBA colors, one row per column.
     - bg_color: RGBA tuple for the background (default is Alice Blue: (240, 248, 255, 1.0)).
+    - out: Optional float32 array of shape (n_columns, n_rows, 4) to fill in place.
 
     Returns:
     - img: Numpy array with shape (n_columns, n_rows, 4) representing the colored boolean image.
     """
-    n_rows, n_cols = data_matrix.shape
-    img = np.full((n_cols, n_rows, 4), bg_color, dtype=float)
-    for col_idx, col_color in enumerate(column_colors):
-        img[col_idx, data_matrix[:, col_idx] == 1, :] = col_color
+    colors = np.asarray(column_colors, dtype=np.float32).reshape(-1, 4)
+    mask = data_matrix.T.astype(bool, copy=False)
+    bg = np.asarray(bg_color, dtype=np.float32)
+    img = np.empty(mask.shape + (4,), dtype=np.float32) if out is None else out
+    kernel = _get_rasterize_kernel() if mask.size >= _NUMBA_MIN_CELLS else None
+    if kernel is not None:
+        kernel(mask, colors, bg, img)
+    else:
+        img[:] = bg
+        # All-False columns keep the background, all-True ones get a single fill.
+        counts = np.count_nonzero(mask, axis=1)
+        full = counts == mask.shape[1]
+        img[full] = colors[full, None, :]
+        partial = np.flatnonzero((counts > 0) & ~full)
+        img[partial] = np.where(mask[partial, :, None],
+                                colors[partial, None, :], bg)
     return img
 
 
 def create_website_active_image(df: pd.DataFrame,
-                                col_name: str = "Website_active") -> np.ndarray:
+                                col_name: str = "Website_active",
+                                out: Optional[np.ndarray] = None) -> np.ndarray:
     """
     Create an image (NumPy array) for displaying website active information.
 
@@ -183,20 +278,71 @@ def create_website_active_image(df: pd.DataFrame,
     Parameters:
     - df: The pandas DataFrame containing website activity data.
     - col_name: The column name representing the website active status.
+    - out: Optional float32 array of shape (1, n_rows, 4) to fill in place.
 
     Returns:
     - img_active: NumPy array of shape (1, n_rows, 4) representing the active status colors.
     """
-    active_vals = df[col_name].astype(str).str.lower().str.strip()
-    colors = [to_rgba(SECONDARY_DARK_COLOR) if val == "yes" else to_rgba(
-        'darkorange') for val in active_vals]
-    img_active = np.array([colors], dtype=float)
+    # One case-insensitive match instead of separate strip/lower/compare passes.
+    mask = df[col_name].astype(str).str.fullmatch(
+        r'\s*yes\s*', case=False).to_numpy(dtype=bool)
+    yes_rgba = np.array(to_rgba(SECONDARY_DARK_COLOR), dtype=np.float32)
+    no_rgba = np.array(to_rgba('darkorange'), dtype=np.float32)
+    img_active = np.empty((1, len(mask), 4), dtype=np.float32) if out is None else out
+    img_active[:] = no_rgba
+    img_active[0, mask] = yes_rgba
     return img_active
 
 
+def downsample_image(img: np.ndarray,
+                     max_width: int) -> Tuple[np.ndarray, int]:
+    """
+    Downsamples an RGBA image along its row (index) axis so it is at most max_width wide.
+
+    Consecutive rows are grouped into blocks and each block is averaged, so a pixel's
+    color reflects the share of flagged rows in its block and the density of missing
+    values stays comparable across rows.
+
+    Parameters:
+    - img: NumPy array of shape (n_columns, n_rows, 4).
+    - max_width: Maximum number of pixels to keep along the row axis.
+
+    Returns:
+    - The downsampled image, or img itself if it already fits.
+    - The number of rows per block (1 if img is returned as is). The last block may
+      hold fewer rows, but the image is meant to span n_blocks * block rows.
+    """
+    n_rows = img.shape[1]
+    if max_width < 1 or n_rows <= max_width:
+        return img, 1
+    block = -(-n_rows // max_width)
+    starts = np.arange(0, n_rows, block)
+    counts = np.diff(np.append(starts, n_rows))
+    means = np.add.reduceat(img, starts, axis=1) / counts[None, :, None]
+    return means.astype(img.dtype, copy=False), block
+
+
+def _fit_heatmap_image(ax: plt.Axes, img_full: np.ndarray) -> None:
+    """
+    Sets img_full on the axes' image, downsampled when it is wider than the axes can show.
+
+    Each pooled block gets at least two screen pixels, which keeps Agg's own resampling
+    from dropping blocks. Must be called once the figure layout is final, since it relies
+    on the axes' size.
+    """
+    img_plot, block = downsample_image(img_full, int(ax.bbox.width) // 2)
+    n_rows_total, n_index = img_full.shape[:2]
+    image = ax.images[0]
+    image.set_data(img_plot)
+    image.set_extent((-0.5, img_plot.shape[1] * block - 0.5,
+                      n_rows_total - 0.5, -0.5))
+    image.set_interpolation('none' if img_plot is img_full else 'nearest')
+    ax.set_xlim(-0.5, n_index - 0.5)
+
+
 def plot_heatmap(img_full: np.ndarray,
                  row_labels: List[str],
-                 column_colors: List[tuple],
+                 column_colors: np.ndarray,
                  color_map: Dict[str, tuple]) -> None:
     """
     Plots a heatmap composed of boolean and website activity images.
@@ -207,18 +353,37 @@ def plot_heatmap(img_full: np.ndarray,
     Parameters:
     - img_full: A NumPy array representing the full combined image.
     - row_labels: List of strings used as labels for the corresponding rows.
-    - column_colors: List of RGBA tuples for coloring the boolean rows' labels.
+    - column_colors: Array of RGBA colors for coloring the boolean rows' labels.
     - color_map: Dictionary mapping suffixes to RGBA colors, used for the legend.
+
+    When DISPLAY_PLOT is off, the image is downsampled to the axes width, and the figure
+    is kept so later calls with the same layout only swap the image data instead of
+    rebuilding the axes, labels and legend.
     """
+    global _CACHED_FIG
+    n_rows_total, n_index = img_full.shape[:2]
+    fig_key = (img_full.shape, tuple(row_labels),
+               np.asarray(column_colors).tobytes(), tuple(color_map))
+
+    if (not params.DISPLAY_PLOT and _CACHED_FIG is not None
+            and _CACHED_FIG[0] == fig_key):
+        fig = _CACHED_FIG[1]
+        _fit_heatmap_image(fig.axes[0], img_full)
+        if params.SAVE_PLOT_AS_FILE:
+            fig.savefig(params.PLOT_FILENAME)
+        return
+
     fig, ax = plt.subplots(figsize=(15, 8))
     ax.set_xlabel('I N D E X', fontsize=8)
     ax.xaxis.set_label_coords(0.02, -0.04)
-    ax.imshow(img_full, aspect='auto', interpolation='none', origin='upper')
 
-    n_rows_total = img_full.shape[0]
+    ax.imshow(img_full, aspect='auto', interpolation='none', origin='upper',
+              extent=(-0.5, n_index - 0.5, n_rows_total - 0.5, -0.5))
+
     ax.set_yticks(np.arange(n_rows_total))
     ax.set_yticklabels(row_labels, fontsize=10)
-    [label.set_va("center") for label in ax.get_yticklabels()]
+    for label in ax.get_yticklabels():
+        label.set_va("center")
 
     # Color the boolean row labels.
     for tick_label, col_color in zip(ax.get_yticklabels()[:-1], column_colors):
@@ -231,29 +396,56 @@ def plot_heatmap(img_full: np.ndarray,
              ha='center', fontsize=10, color=PRIMARY_DARK_COLOR, fontstyle='italic', alpha=0.6)
 
     # Build legend (from color map and website active status).
-    legend_handles = [
-        mpatches.Patch(color=color, label=(
-            suffix.replace('.csv', '') if suffix else 'default'))
-        for suffix, color in color_map.items()
-    ]
-    legend_handles.append(mpatches.Patch(color='none', label=''))
-    legend_handles.append(mpatches.Patch(color='none', label='LINK ACTIVE'))
-    legend_handles.extend([
+    labels = [suffix.replace('.csv', '') if suffix else 'default'
+              for suffix in color_map]
+    legend_handles = [mpatches.Patch(color=color, label=label)
+                      for color, label in zip(color_map.values(), labels)]
+    legend_handles += [
+        mpatches.Patch(color='none', label=''),
+        mpatches.Patch(color='none', label='LINK ACTIVE'),
         mpatches.Patch(color=SECONDARY_DARK_COLOR, label='yes'),
         mpatches.Patch(color='darkorange', label='no')
-    ])
+    ]
     plt.legend(handles=legend_handles, title='DATASETS  ',
                frameon=False, bbox_to_anchor=(1.05, 1), loc='upper left')
 
     plt.tight_layout()
+    # Headless, don't rasterize more index pixels than the axes can display. An
+    # interactive window keeps the full image so zooming still shows individual rows.
+    if not params.DISPLAY_PLOT:
+        _fit_heatmap_image(ax, img_full)
 
     if params.SAVE_PLOT_AS_FILE:
-        plt.savefig(params.PLOT_FILENAME)
+        fig.savefig(params.PLOT_FILENAME)
     if params.DISPLAY_PLOT:
         plt.show()
 
     plt.close(fig)
+    _CACHED_FIG = None if params.DISPLAY_PLOT else (fig_key, fig)
+
+
 
+def report_matches_file(df: pd.DataFrame, filename: str) -> bool:
+    """
+    Checks whether a CSV file already holds the same data as the DataFrame.
+
+    Parsing the existing file is cheaper than formatting and rewriting it, so this
+    lets callers skip a redundant write when the report is unchanged.
+
+    Parameters:
+    - df: The pandas DataFrame about to be saved.
+    - filename: Path of the CSV file to compare against.
+
+    Returns:
+    - True if the file exists and its content equals df, False otherwise.
+    """
+    if not Path(filename).is_file():
+        return False
+    try:
+        on_disk = pd.read_csv(filename)
+    except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError):
+        return False
+    return on_disk.equals(df)
 
 
 # ---------------------------------------------------------------------------
@@ -276,21 +468,26 @@ def main(df: pd.DataFrame,
     data_matrix, bases, suffixes = process_boolean_columns(
         df, ignore_cols=["Link", "Website_active"], selected_bases=selected_bases)
     color_map, column_colors = generate_color_map(suffixes)
-    img_bool = create_boolean_image(data_matrix, column_colors)
-    img_active = create_website_active_image(df, col_name="Website_active")
-    img_full = np.vstack([img_bool, img_active])
+    # Both images are written straight into one preallocated buffer.
+    n_rows, n_cols = data_matrix.shape
+    img_full = np.empty((n_cols + 1, n_rows, 4), dtype=np.float32)
+    create_boolean_image(data_matrix, column_colors, out=img_full[:n_cols])
+    create_website_active_image(
+        df, col_name="Website_active", out=img_full[n_cols:])
     row_labels = bases + ['link active']
     plot_heatmap(img_full, row_labels, column_colors, color_map)
 
-    # Save the missing report if the flag is set.
+    # Save the missing report if the flag is set (and it differs from the file).
     if save_missing_report and missing_report_filename:
-        df.to_csv(missing_report_filename, index=False)
+        if not report_matches_file(df, missing_report_filename):
+            df.to_csv(missing_report_filename, index=False)
 
 
 if __name__ == '__main__':
     # Specify filename in case you run it directly from this .py file
     df = pd.read_csv(params.MISSING_FLAGS_FILENAME)
     if params.SORT_DF:
-        df.sort_values(by=[params.SORT_COLUMN])
+        df = df.sort_values(by=params.SORT_COLUMN, kind='stable',
+                            ignore_index=True)
     main(df, save_missing_report=True,
          missing_report_filename=params.MISSING_FLAGS_FILENAME)